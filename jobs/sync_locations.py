@@ -4,91 +4,79 @@
 """
 
 import csv
-from dataclasses import dataclass
-from itertools import chain
-from io import StringIO
-from typing import Optional
-
-from nautobot.apps.jobs import FileVar, Job, register_jobs
+import io
+import logging
+from collections import Counter
+from itertools import chain, islice
+from operator import itemgetter
+from typing import NamedTuple, Optional
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from nautobot.apps.jobs import FileVar, IntegerVar, Job, register_jobs
 from nautobot.dcim.models import Location, LocationType
 from nautobot.extras.models import Status
 
+from ._state_map import STATE_ABBREVIATION_TO_FULL_NAME_MAP
+
 name = "Wayne Enterprises: Custom Jobs"
 
 
-STATE_ABBREVIATION_TO_FULL_NAME_MAP = {
-    "AL": "Alabama",
-    "KY": "Kentucky",
-    "OH": "Ohio",
-    "AK": "Alaska",
-    "LA": "Louisiana",
-    "OK": "Oklahoma",
-    "AZ": "Arizona",
-    "ME": "Maine",
-    "OR": "Oregon",
-    "AR": "Arkansas",
-    "MD": "Maryland",
-    "PA": "Pennsylvania",
-    "AS": "American Samoa",
-    "MA": "Massachusetts",
-    "PR": "Puerto Rico",
-    "CA": "California",
-    "MI": "Michigan",
-    "RI": "Rhode Island",
-    "CO": "Colorado",
-    "MN": "Minnesota",
-    "SC": "South Carolina",
-    "CT": "Connecticut",
-    "MS": "Mississippi",
-    "SD": "South Dakota",
-    "DE": "Delaware",
-    "MO": "Missouri",
-    "TN": "Tennessee",
-    "DC": "District of Columbia",
-    "MT": "Montana",
-    "TX": "Texas",
-    "FL": "Florida",
-    "NE": "Nebraska",
-    "TT": "Trust Territories",
-    "GA": "Georgia",
-    "NV": "Nevada",
-    "UT": "Utah",
-    "GU": "Guam",
-    "NH": "New Hampshire",
-    "VT": "Vermont",
-    "HI": "Hawaii",
-    "NJ": "New Jersey",
-    "VA": "Virginia",
-    "ID": "Idaho",
-    "NM": "New Mexico",
-    "VI": "Virgin Islands",
-    "IL": "Illinois",
-    "NY": "New York",
-    "WA": "Washington",
-    "IN": "Indiana",
-    "NC": "North Carolina",
-    "WV": "West Virginia",
-    "IA": "Iowa",
-    "ND": "North Dakota",
-    "WI": "Wisconsin",
-    "KS": "Kansas",
-    "MP": "Northern Mariana Islands",
-    "WY": "Wyoming",
-}
+# Rows per INSERT/UPDATE statement; keeps each statement well under PostgreSQL's bind parameter limit.
+BULK_BATCH_SIZE = 1000
 
+# Site name suffixes are all three characters long, so a site's type is one slice and dict lookup away.
+SITE_SUFFIX_TO_LOCATION_TYPE = {
+    "-BR": "Branch",
+    "-DC": "Data Center",
+}
 
-@dataclass
-class LocationRecord:
+# City names repeat across states (Springfield, IL and Springfield, MO), so a City is identified by its
+# name together with its State's name and a City under a new State is a new Location. Sites and States
+# are identified by name alone, so a site that moves to another City is re-parented in place.
+LOCATION_TYPES_KEYED_BY_PARENT = frozenset({"City"})
+
+
+def iter_location_csv_rows(source_file):
+    """Yield a (name, city, state) tuple for each row of an uploaded locations CSV file.
+
+    The upload is decoded as it is read and column positions are resolved once from the
+    header row, so neither the whole file nor a per-row dict is ever held in memory.
+    The text wrapper is detached afterwards so it does not close the uploaded file
+    when it is garbage collected; Nautobot still owns that file.
+    """
+    text = io.TextIOWrapper(source_file, encoding="utf-8", newline="")
+    try:
+        reader = csv.reader(text)
+        header = next(reader, None)
+        if header is None:
+            return
+        get_columns = itemgetter(header.index("name"), header.index("city"), header.index("state"))
+        for row in reader:
+            if row:  # DictReader skipped blank lines; keep doing so.
+                yield get_columns(row)
+    finally:
+        text.detach()
+
+
+class LocationRecord(NamedTuple):
     name: str
     location_type__name: str
     parent__name: Optional[str]
     parent__location_type__name: Optional[str]
+    parent__parent__name: Optional[str] = None
 
 
 class LocationsCSVImportJob(Job):
     """Job that imports Location data from a CSV file."""
 
     source_file = FileVar(description="CSV file containing Locations data")
+    chunk_size = IntegerVar(
+        default=10000,
+        min_value=1,
+        description="Number of CSV rows to read and write per batch",
+    )
 
     class Meta:
         """Metaclass attributes of LocationsCSVImportJob."""
@@ -96,41 +84,70 @@ class LocationsCSVImportJob(Job):
         name = "Import locations from CSV file."
         description = "Job that keeps the Locations table up to date."
 
-    def run(self, source_file):
-        """Execute job logic."""
+    def run(self, source_file, chunk_size=10000):
+        """Execute job logic.
+
+        The CSV is processed chunk_size rows at a time so memory stays bounded for large files.
+        States and cities already synced by an earlier chunk are not emitted again.
+        """
         self.source_file = source_file
-        csv_records = self.get_csv_records(self.source_file)
-        csv_records = self.translate_state_names(csv_records)
-        location_records = self.iter_all_location_records(csv_records)
-        self.process_source_records(location_records)
-
-    def get_csv_records(self, source_file):
-        text = source_file.read().decode("utf-8")
-        csv_data = csv.DictReader(StringIO(text))
-        records = list(csv_data)
-        return records
-
-    def translate_state_names(self, csv_records):
-        return [self.fix_state_name_in_source_record(r) for r in csv_records]
-
-    def fix_state_name_in_source_record(self, record):
-        state_name = record["state"]
-        state_name = STATE_ABBREVIATION_TO_FULL_NAME_MAP.get(state_name, state_name)
-        return {
-            "name": record["name"],
-            "city": record["city"],
-            "state": state_name,
-        }
+        self.seen_states = set()
+        self.seen_cities = set()
+        self.sync_counts = Counter()
+        # Scoped to this run so a LocationType or Status changed from another process is never served stale.
+        self.location_types = {lt.name: lt for lt in LocationType.objects.all()}
+        self.active_status = Status.objects.get(name="Active")
+        csv_records = iter_location_csv_rows(self.source_file)
+        while chunk := list(islice(csv_records, chunk_size)):
+            location_records = self.iter_all_location_records(chunk)
+            self.process_source_records(location_records)
+        self.logger.info(
+            f"Sync complete: {self.sync_counts['created']} created, "
+            f"{self.sync_counts['updated']} updated, {self.sync_counts['unchanged']} unchanged, "
+            f"{self.sync_counts['skipped']} skipped"
+        )
 
     def iter_all_location_records(self, records):
+        state_names, cities, site_records = self.scan_records(records)
+        state_names -= self.seen_states
+        cities -= self.seen_cities
+        self.seen_states |= state_names
+        self.seen_cities |= cities
         yield from chain(
-            self.get_states(records),
-            self.get_cities(records),
-            self.get_location_sites(records),
+            self.get_states(state_names),
+            self.get_cities(cities),
+            site_records,
         )
 
-    def get_states(self, records):
-        state_names = set(r["state"] for r in records)
+    def scan_records(self, records):
+        """Collect states, cities and site LocationRecords in a single pass over the CSV rows."""
+        xlate_state = STATE_ABBREVIATION_TO_FULL_NAME_MAP.get
+        site_location_type = SITE_SUFFIX_TO_LOCATION_TYPE.get
+        state_names = set()
+        cities = set()
+        add_state = state_names.add
+        add_city = cities.add
+        site_records = {}
+        for site_name, city_name, state_name in records:
+            state_name = xlate_state(state_name, state_name)
+            add_state(state_name)
+            add_city((city_name, state_name))
+            location_type__name = site_location_type(site_name[-3:])
+            if location_type__name is None:
+                self.logger.warning("'%s' is not a Branch or Data Center", site_name)
+                continue
+            if site_name in site_records:
+                self.logger.debug("'%s' appears more than once, keeping the last row", site_name)
+            site_records[site_name] = LocationRecord(
+                name=site_name,
+                location_type__name=location_type__name,
+                parent__name=city_name,
+                parent__location_type__name="City",
+                parent__parent__name=state_name,
+            )
+        return state_names, cities, site_records.values()
+
+    def get_states(self, state_names):
         state_records = [
             LocationRecord(
                 name=state_name,
@@ -142,8 +159,7 @@ class LocationsCSVImportJob(Job):
         ]
         return state_records
 
-    def get_cities(self, records):
-        cities = set((r["city"], r["state"]) for r in records)
+    def get_cities(self, cities):
         city_records = [
             LocationRecord(
                 name=city_name,
@@ -155,101 +171,156 @@ class LocationsCSVImportJob(Job):
         ]
         return city_records
 
-    def get_location_sites(self, records):
-        site_records = []
-        for site in records:
-            site_name = site["name"]
-            city_name = site["city"]
-            if site_name.endswith("-BR"):
-                location_type__name = "Branch"
-            elif site_name.endswith("-DC"):
-                location_type__name = "Data Center"
-            else:
-                self.logger.warn(f"'{site_name}' is not a Branch or Data Center")
-                continue
-            record = LocationRecord(
-                name=site_name,
-                location_type__name=location_type__name,
-                parent__name=city_name,
-                parent__location_type__name="City",
-            )
-            site_records.append(record)
-        return site_records
-
     def process_source_records(self, location_records):
-        existing_locations = self.get_existing_locations()
-        active_status = Status.objects.get(name="Active")
-        for record in location_records:
-            identifiers = record.name, record.location_type__name
-            if identifiers not in existing_locations:
-                self.create_new_location(record, active_status)
-                continue
+        """Create or update Locations in bulk, one LocationType tier at a time.
 
-            existing_location_attributes = existing_locations[identifiers]
-            record_attributes = (
-                record.parent__name,
-                record.parent__location_type__name,
-                "Active",
-            )
-            if record_attributes != existing_location_attributes:
-                self.update_existing_location(record, active_status)
-
-        # This code can be used to clean up locations that are not in the source file.
-        # Alternatively, we could just mark them as status="Decommissioned".
-        self.delete_missing_locations(location_records, existing_locations)
-
-    def get_existing_locations(self):
-        locations = Location.objects.values_list(
-            "name",
-            "location_type__name",
-            "parent__name",
-            "parent__location_type__name",
-            "status__name",
+        Records arrive ordered parents-first (states, cities, sites), so grouping
+        them by LocationType in arrival order keeps every parent tier synced
+        before the tier that references it.
+        """
+        records_by_type = {}
+        self.parent_names = {}
+        self.parents_by_type = {}
+        for record in location_records:
+            records_by_type.setdefault(record.location_type__name, []).append(record)
+            if record.parent__name and record.parent__location_type__name:
+                self.parent_names.setdefault(record.parent__location_type__name, set()).add(record.parent__name)
+
+        with transaction.atomic():
+            for location_type_name, records in records_by_type.items():
+                self.sync_tier(records, location_type_name)
+
+            # This code can be used to clean up locations that are not in the source file.
+            # Alternatively, we could just mark them as status="Decommissioned".
+            self.delete_missing_locations(records_by_type)
+
+    def sync_tier(self, records, location_type_name):
+        """Bulk create or update all Locations of a single LocationType."""
+        location_type = self.get_location_type(location_type_name)
+        self.validate_tier(records, location_type)
+        keyed_by_parent = location_type_name in LOCATION_TYPES_KEYED_BY_PARENT
+        wanted = {(r.name, r.parent__name if keyed_by_parent else None): r for r in records}
+        # The fetched instances are mutated and written back directly, so only the diffed columns are loaded.
+        existing_locations = (
+            Location.objects.filter(location_type=location_type, name__in={r.name for r in records})
+            .select_related("parent")
+            .only("id", "name", "parent", "status", "parent__name")
         )
-        return {
-            (name, location_type): (parent, parent__location_type, status__name)
-            for name, location_type, parent, parent__location_type, status__name in locations
+        existing = {
+            (loc.name, loc.parent.name if keyed_by_parent and loc.parent_id else None): loc
+            for loc in existing_locations
         }
 
-    def create_new_location(self, record: LocationRecord, status: Status):
-        """Create a Location model instance when none exists."""
-        location_type = self.get_location_type(record)
-        parent = self.get_parent(record)
-        obj = Location.objects.create(
-            name=record.name,
-            location_type=location_type,
-            parent=parent,
-            status=status,
+        active_status_id = self.active_status.pk
+        to_create = []
+        to_update = []
+        unchanged = 0
+        skipped = 0
+        for key, record in wanted.items():
+            parent = self.get_parent(record)
+            if parent is None and record.parent__name:
+                # Writing the row anyway would create it without a parent or clear an existing one.
+                self.logger.warning(
+                    "Skipping %s '%s': parent %s '%s' was not found",
+                    location_type_name,
+                    record.name,
+                    record.parent__location_type__name,
+                    record.parent__name,
+                )
+                skipped += 1
+                continue
+            obj = existing.get(key)
+            if obj is None:
+                to_create.append(
+                    Location(
+                        name=record.name,
+                        location_type=location_type,
+                        parent=parent,
+                        status=self.active_status,
+                    )
+                )
+                continue
+
+            # Compare foreign key ids only, so unchanged rows are skipped without loading related objects.
+            if obj.parent_id != (parent.pk if parent else None) or obj.status_id != active_status_id:
+                obj.parent = parent
+                obj.status = self.active_status
+                to_update.append(obj)
+            else:
+                unchanged += 1
+
+        # Conflicts raise IntegrityError and roll back the chunk, as Location.objects.create() did, so
+        # every instance in to_create is really stored and can be counted and logged as created.
+        # PostgreSQL COPY is deliberately not used: Location fills its UUID primary key, timestamps
+        # and custom field data from Python-side defaults that only the ORM applies.
+        Location.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+        # bulk_update bypasses save(), so the auto_now last_updated timestamp is set here explicitly.
+        now = timezone.now()
+        for obj in to_update:
+            obj.last_updated = now
+        Location.objects.bulk_update(
+            to_update, fields=["parent", "status", "last_updated"], batch_size=BULK_BATCH_SIZE
         )
-        self.logger.info(f"Created a new record for {obj}", extra={"object": obj})
-        return obj
-
-    def update_existing_location(self, record: LocationRecord, status: Status):
-        """Create a Location model instance when none exists."""
-        location_type = self.get_location_type(record)
-        parent = self.get_parent(record)
-        obj = Location.objects.get(name=record.name, location_type=location_type)
-        obj.parent = parent
-        obj.status = status
-        obj.validated_save()
-        self.logger.info(f"Updated location record for {obj}", extra={"object": obj})
-        return obj
+        self.sync_counts["created"] += len(to_create)
+        self.sync_counts["updated"] += len(to_update)
+        self.sync_counts["unchanged"] += unchanged
+        self.sync_counts["skipped"] += skipped
+        # Every job log entry is a database write, so per-object entries are only emitted when debugging.
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for obj in to_create:
+                self.logger.debug("Created a new record for %s", obj, extra={"object": obj})
+            for obj in to_update:
+                self.logger.debug("Updated location record for %s", obj, extra={"object": obj})
+
+    def validate_tier(self, records, location_type):
+        """Apply Location.clean()'s parent LocationType rule once per tier.
+
+        bulk_create and bulk_update skip model validation, and every record in a tier shares
+        the same parent LocationType, so checking the type pairing once replaces a per-row full_clean().
+        """
+        allowed_parent_type_ids = {location_type.parent_id}
+        if location_type.nestable:
+            allowed_parent_type_ids.add(location_type.pk)
+        for parent_type_name in {r.parent__location_type__name for r in records}:
+            parent_type_id = self.get_location_type(parent_type_name).pk if parent_type_name else None
+            if parent_type_id not in allowed_parent_type_ids:
+                raise ValidationError(
+                    f"A Location of type {location_type} cannot have a parent of type {parent_type_name}"
+                )
 
     def get_parent(self, record):
         """Return a Parent Location object matching the record's parent attributes."""
-        if record.parent__name and record.parent__location_type__name:
-            results = Location.objects.filter(
-                name=record.parent__name,
-                location_type__name=record.parent__location_type__name,
+        parent_type_name = record.parent__location_type__name
+        if not (record.parent__name and parent_type_name):
+            return None
+        if parent_type_name not in self.parents_by_type:
+            self.parents_by_type[parent_type_name] = self.get_parents(parent_type_name)
+        return self.parents_by_type[parent_type_name].get((record.parent__name, record.parent__parent__name))
+
+    def get_parents(self, parent_type_name):
+        """Return every parent Location of the given type referenced by the source.
+
+        Results are keyed by (name, parent name) because a city name alone is ambiguous across states.
+        Called lazily on the first lookup, after the parent tier has been synced.
+        """
+        results = (
+            Location.objects.filter(
+                name__in=self.parent_names[parent_type_name],
+                location_type=self.get_location_type(parent_type_name),
             )
-            return results.first()
+            .select_related("parent")
+            .only("id", "name", "parent", "parent__name")
+        )
+        return {(loc.name, loc.parent.name if loc.parent_id else None): loc for loc in results}
 
-    def get_location_type(self, record):
-        """Return a LocationType object matching the record.location_type__name."""
-        results = LocationType.objects.filter(name=record.location_type__name)
-        return results.first()
+    def get_location_type(self, location_type_name):
+        """Return the LocationType with the given name from the run's cache."""
+        try:
+            return self.location_types[location_type_name]
+        except KeyError:
+            raise LocationType.DoesNotExist(f"LocationType '{location_type_name}' does not exist") from None
 
-    def delete_missing_locations(self, location_records, existing_locations):
+    def delete_missing_locations(self, records_by_type):
         """Remove existing locations that are not in the source file.
 
         Alternatively, we could just mark them as status="Decommissioned".
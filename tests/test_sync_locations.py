@@ -0,0 +1,62 @@
+"""Tests for the Sync Locations From CSV Job."""
+
+import io
+
+from nautobot.apps.testing import TestCase
+from nautobot.dcim.models import Location, LocationType
+from nautobot.extras.models import Status
+
+from jobs.sync_locations import LocationsCSVImportJob
+
+
+class LocationsCSVImportJobTestCase(TestCase):
+    """Run the job against the database and check the resulting Location tree."""
+
+    @classmethod
+    def setUpTestData(cls):
+        state = LocationType.objects.create(name="State")
+        city = LocationType.objects.create(name="City", parent=state)
+        LocationType.objects.create(name="Branch", parent=city)
+        LocationType.objects.create(name="Data Center", parent=city)
+        cls.active_status = Status.objects.get(name="Active")
+
+    def run_job(self, csv_text, chunk_size=10000):
+        job = LocationsCSVImportJob()
+        job.run(io.BytesIO(csv_text.encode("utf-8")), chunk_size=chunk_size)
+
+    def get_site_state_name(self, site_name):
+        return Location.objects.get(name=site_name).parent.parent.name
+
+    def test_same_city_name_in_two_states(self):
+        self.run_job("name,city,state\nSPI-BR,Springfield,IL\nSPM-BR,Springfield,MO\n")
+
+        cities = Location.objects.filter(location_type__name="City", name="Springfield")
+        self.assertEqual(sorted(city.parent.name for city in cities), ["Illinois", "Missouri"])
+        self.assertEqual(self.get_site_state_name("SPI-BR"), "Illinois")
+        self.assertEqual(self.get_site_state_name("SPM-BR"), "Missouri")
+
+    def test_same_city_name_in_two_chunks(self):
+        self.run_job("name,city,state\nSPM-BR,Springfield,MO\n")
+        missouri_springfield = Location.objects.get(name="Springfield", parent__name="Missouri")
+
+        # Each row is its own chunk, so Springfield, IL is synced without Springfield, MO in view.
+        self.run_job("name,city,state\nSPI-BR,Springfield,IL\nSPM-BR,Springfield,MO\n", chunk_size=1)
+
+        self.assertEqual(Location.objects.filter(location_type__name="City", name="Springfield").count(), 2)
+        missouri_springfield.refresh_from_db()
+        self.assertEqual(missouri_springfield.parent.name, "Missouri")
+        self.assertEqual(self.get_site_state_name("SPI-BR"), "Illinois")
+        self.assertEqual(self.get_site_state_name("SPM-BR"), "Missouri")
+
+    def test_site_moved_to_another_city(self):
+        self.run_job("name,city,state\nDEN-DC,Denver,CO\n")
+        site = Location.objects.get(name="DEN-DC")
+        created_last_updated = site.last_updated
+
+        self.run_job("name,city,state\nDEN-DC,Boulder,CO\n")
+
+        site.refresh_from_db()
+        self.assertEqual(site.parent.name, "Boulder")
+        self.assertGreater(site.last_updated, created_last_updated)
+        self.assertEqual(site.status, self.active_status)
+        self.assertEqual(Location.objects.filter(name="DEN-DC").count(), 1)